@@ -2,19 +2,55 @@
 # Explainify — Complete Rebuilt Backend with New Flow
 # ============================================================
 
+# Patch the stdlib for cooperative I/O before anything imports requests,
+# so gunicorn's gevent workers can overlap the long upstream LLM calls
+from gevent import monkey
+monkey.patch_all()
+
 import os
-import json
+import queue
+import threading
+import time
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from typing import Annotated
+
+import msgspec
+import orjson
+import redis
 import requests
+from cachetools import TTLCache
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import google.generativeai as genai
 from flask import Flask, request, jsonify, send_from_directory, Response
+from flask.json.provider import JSONProvider
+from flask_compress import Compress
 from flask_cors import CORS
 from dotenv import load_dotenv
 
 load_dotenv()
 
+class OrjsonProvider(JSONProvider):
+    """JSON provider backed by orjson so jsonify encodes/decodes in C"""
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+
 app = Flask(__name__, static_folder='.')
+app.json = OrjsonProvider(app)
 CORS(app)
 
+# Compress JSON/HTML responses (brotli preferred, gzip fallback); the
+# SSE stream is text/event-stream and is left untouched
+app.config["COMPRESS_ALGORITHM"] = ["br", "gzip"]
+Compress(app)
+
 DEEPSEEK_API_KEY = os.getenv("DEEPSEEK_API_KEY", "").strip()
 if not DEEPSEEK_API_KEY:
     raise Exception("Missing DEEPSEEK_API_KEY in .env")
@@ -23,12 +59,201 @@ GEMINI_API_KEY = os.getenv("GEMINI_API_KEY", "").strip()
 if not GEMINI_API_KEY:
     print("Warning: GEMINI_API_KEY not found. Study suggestions will not be available.")
 
-# Configure Gemini AI if key is available
+# Configure Gemini AI once at import if a key is available; the warm
+# model handle is reused by every request rather than rebuilt per call
+gemini_model = None
 if GEMINI_API_KEY:
     genai.configure(api_key=GEMINI_API_KEY)
     gemini_model = genai.GenerativeModel('gemini-pro')
 
 DEEPSEEK_URL = "https://openrouter.ai/api/v1/chat/completions"
+DEEPSEEK_MODEL = "deepseek/deepseek-chat"
+DEEPSEEK_TEMPERATURE = 0.4
+# Hard cap on completion length; a full lesson fits comfortably, and a
+# runaway generation stops costing tokens and latency at the cap
+DEEPSEEK_MAX_TOKENS = int(os.getenv("DEEPSEEK_MAX_TOKENS", "6000"))
+DEEPSEEK_HEADERS = {
+    "Authorization": f"Bearer {DEEPSEEK_API_KEY}",
+    "Content-Type": "application/json",
+    # brotli is installed, so urllib3 can accept and decode br alongside gzip
+    "Accept-Encoding": "gzip, deflate, br",
+    "HTTP-Referer": "http://localhost",
+    "X-Title": "Explainify"
+}
+
+# Generated lessons for a topic are stable, so identical topics within
+# the TTL are served from memory instead of paying the upstream call
+CACHE_TTL_SECONDS = 24 * 3600
+LESSON_CACHE = TTLCache(maxsize=256, ttl=CACHE_TTL_SECONDS)
+SUGGESTION_CACHE = TTLCache(maxsize=256, ttl=CACHE_TTL_SECONDS)
+CACHE_LOCK = threading.Lock()
+
+
+def _lesson_cache_key(topic: str):
+    return (topic.strip().lower(), DEEPSEEK_MODEL, DEEPSEEK_TEMPERATURE)
+
+
+# Prompt templates are built once at import time; per request we only
+# substitute the topic instead of reassembling the whole string. The
+# structure and rules blocks are shared between the single-topic and
+# batched prompts so the two can never drift apart.
+_LESSON_STRUCTURE = """{{
+  "teaching_content": {{
+    "title": "string",
+    "introduction": "string",
+    "sections": [
+      {{
+        "heading": "string",
+        "content": "string"
+      }}
+    ],
+    "summary": "string"
+  }},
+  "flashcards": [
+    {{
+      "title": "string",
+      "explanation": "string",
+      "key_point": "string"
+    }}
+  ],
+  "quiz": [
+    {{
+      "question": "string",
+      "options": ["A", "B", "C", "D"],
+      "answer": "string"
+    }}
+  ],
+  "test": {{
+    "mcq_questions": [
+      {{
+        "question": "string",
+        "options": ["A", "B", "C", "D"],
+        "answer": "string",
+        "explanation": "string"
+      }}
+    ],
+    "qa_questions": [
+      {{
+        "question": "string",
+        "answer": "string"
+      }}
+    ]
+  }}
+}}"""
+
+_LESSON_RULES = """STRICT RULES:
+1. teaching_content: complete lesson with introduction, 3-5 sections, and summary
+2. Exactly 5 flashcards and 5 quiz questions
+3. test: 5 MCQ questions and 3 Q&A questions
+4. Every MCQ has exactly 4 options; every answer must be the EXACT text of one option
+5. No text outside JSON"""
+
+DEEPSEEK_PROMPT_TEMPLATE = f"""
+Return ONLY valid JSON. No markdown, no notes, no explanations.
+
+Generate comprehensive learning content for the topic: "{{topic}}"
+
+Your output MUST follow the EXACT structure:
+
+{_LESSON_STRUCTURE}
+
+{_LESSON_RULES}
+"""
+
+DEEPSEEK_BATCH_PROMPT_TEMPLATE = f"""
+Return ONLY valid JSON. No markdown, no notes, no explanations.
+
+Generate comprehensive learning content for EACH of the following topics: {{topics}}
+
+Your output MUST be a single JSON object with one key per topic, spelled
+exactly as listed above. Each topic's value MUST follow the EXACT structure:
+
+{_LESSON_STRUCTURE}
+
+{_LESSON_RULES}
+6. Apply every rule to every topic independently
+"""
+
+SUGGESTIONS_PROMPT_TEMPLATE = """
+    Based on the topic "{topic}" that the user just studied, suggest 3-4 closely related topics they should study next.
+
+    For each suggestion, provide:
+    1. Topic name (short, specific, and relevant)
+    2. Brief description explaining why it's a good next step
+
+    Format the response as a valid JSON array of objects with this exact structure:
+    [
+      {{
+        "topic": "specific topic name here",
+        "description": "brief explanation of why this is a good next topic, maximum 15 words"
+      }},
+      ...
+    ]
+
+    Make sure topics are:
+    - Directly related to {topic}
+    - Logical progression from what was learned
+    - Not too advanced or too basic
+    - Specific and actionable
+
+    Return ONLY the JSON array, no additional text.
+    """
+
+
+def _extract_json_block(text: str, open_char: str = "{", close_char: str = "}"):
+    """Find the first balanced JSON object/array in text with a single pass.
+
+    Tracks nesting depth and skips over string literals (including escaped
+    quotes), so a brace inside lesson text can't truncate the block the way
+    find/rfind slicing could. Returns None if no balanced block exists.
+    """
+    start = -1
+    depth = 0
+    in_string = False
+    escaped = False
+    for i, ch in enumerate(text):
+        if start == -1:
+            if ch == open_char:
+                start = i
+                depth = 1
+            continue
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == '"':
+                in_string = False
+            continue
+        if ch == '"':
+            in_string = True
+        elif ch == open_char:
+            depth += 1
+        elif ch == close_char:
+            depth -= 1
+            if depth == 0:
+                return text[start:i + 1]
+    return None
+
+# Shared pool for running the independent LLM calls concurrently
+EXECUTOR = ThreadPoolExecutor(max_workers=8)
+
+# Persistent session so repeated DeepSeek calls reuse the same TCP+TLS
+# connection instead of paying the handshake cost every time. POST must
+# be added to allowed_methods explicitly - urllib3 excludes it by
+# default, which would make the status_forcelist dead code for the only
+# request we ever send. Retry-After on 429 is honored by default.
+SESSION = requests.Session()
+SESSION.mount("https://", HTTPAdapter(
+    pool_connections=32,
+    pool_maxsize=32,
+    max_retries=Retry(
+        total=2,
+        backoff_factor=0.3,
+        status_forcelist=[429, 502, 503, 504],
+        allowed_methods=Retry.DEFAULT_ALLOWED_METHODS | {"POST"}
+    )
+))
 
 
 # -------------------------------------------------------------
@@ -54,72 +279,217 @@ def api_generate():
         if not topic:
             return jsonify({"error": "Topic required"}), 400
 
-        result = call_deepseek(topic)
-        
-        # Add study suggestions if Gemini is configured
-        if GEMINI_API_KEY:
-            try:
-                study_suggestions = generate_study_suggestions(topic)
-                result["study_suggestions"] = study_suggestions
-            except Exception as e:
-                print(f"Failed to generate study suggestions: {e}")
-                result["study_suggestions"] = [
-                    {"topic": "Related concepts", "description": "Explore concepts closely related to what you just learned"},
-                    {"topic": "Advanced topics", "description": "Dive deeper into more advanced aspects"},
-                    {"topic": "Practical applications", "description": "Learn how this knowledge is applied in real-world scenarios"}
-                ]
+        # Fire both LLM calls concurrently - they are independent, so the
+        # user waits for max(deepseek, gemini) instead of their sum
+        deepseek_future = EXECUTOR.submit(call_deepseek, topic)
+        suggestions_future = EXECUTOR.submit(generate_study_suggestions, topic) if gemini_model is not None else None
+
+        result = deepseek_future.result()
+        _attach_study_suggestions(result, suggestions_future)
 
         return jsonify(result)
 
+    except UpstreamUnavailable as e:
+        return jsonify({"error": str(e)}), 503
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 
+def _attach_study_suggestions(result, suggestions_future):
+    """Merge the Gemini future into the result, falling back on failure"""
+    if suggestions_future is None:
+        return
+    try:
+        result["study_suggestions"] = suggestions_future.result()
+    except Exception as e:
+        print(f"Failed to generate study suggestions: {e}")
+        result["study_suggestions"] = [
+            {"topic": "Related concepts", "description": "Explore concepts closely related to what you just learned"},
+            {"topic": "Advanced topics", "description": "Dive deeper into more advanced aspects"},
+            {"topic": "Practical applications", "description": "Learn how this knowledge is applied in real-world scenarios"}
+        ]
+
+
+# -------------------------------------------------------------
+# STREAMING API ENDPOINT - SSE with progressive deltas
+# -------------------------------------------------------------
+@app.route("/api/generate/stream", methods=["POST", "OPTIONS"])
+def api_generate_stream():
+    if request.method == "OPTIONS":
+        return Response(status=200)
+
+    data = request.get_json()
+    topic = data.get("topic", "").strip()
+
+    if not topic:
+        return jsonify({"error": "Topic required"}), 400
+
+    def event_stream():
+        suggestions_future = EXECUTOR.submit(generate_study_suggestions, topic) if gemini_model is not None else None
+
+        # Same payload shape regardless of cache state: a hit still gets
+        # study_suggestions merged in (cheap on repeat, they cache too)
+        cache_key = _lesson_cache_key(topic)
+        with CACHE_LOCK:
+            cached = LESSON_CACHE.get(cache_key)
+        if cached is not None:
+            result = dict(cached)
+            _attach_study_suggestions(result, suggestions_future)
+            yield _sse_event("result", result)
+            return
+
+        # Forward content deltas to the client while the model is still
+        # writing, so the frontend can render the lesson progressively
+        # instead of staring at a spinner for the whole generation
+        deltas = queue.Queue()
+        lesson_future = EXECUTOR.submit(_generate_lesson, topic, deltas.put)
+        lesson_future.add_done_callback(lambda f: deltas.put(None))
+
+        while True:
+            piece = deltas.get()
+            if piece is None:
+                break
+            yield _sse_event("delta", {"text": piece})
+
+        try:
+            result = lesson_future.result()
+            _validate_lesson(result)
+        except Exception as e:
+            yield _sse_event("error", {"error": str(e)})
+            return
+
+        with CACHE_LOCK:
+            LESSON_CACHE[cache_key] = result
+
+        result = dict(result)
+        _attach_study_suggestions(result, suggestions_future)
+        yield _sse_event("result", result)
+
+    return Response(
+        event_stream(),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+def _sse_event(event: str, payload) -> str:
+    return f"event: {event}\ndata: {orjson.dumps(payload).decode()}\n\n"
+
+
+# -------------------------------------------------------------
+# ASYNC JOB API - Enqueue generation, poll for the result
+# -------------------------------------------------------------
+# Job state is a plain JSON dict so it can live in Redis when REDIS_URL
+# is set - required under gunicorn with multiple workers, where a poll
+# usually lands on a different process than the one running the job.
+# Without Redis the in-process store only works with a single worker.
+# Finished jobs expire after the TTL so uncollected results don't pile up.
+JOB_TTL_SECONDS = 15 * 60
+
+
+class _RedisJobStore:
+    def __init__(self, url: str):
+        self.client = redis.Redis.from_url(url)
+
+    def set(self, job_id: str, state: dict):
+        self.client.setex(f"explainify:job:{job_id}", JOB_TTL_SECONDS, orjson.dumps(state))
+
+    def get(self, job_id: str):
+        raw = self.client.get(f"explainify:job:{job_id}")
+        return orjson.loads(raw) if raw is not None else None
+
+
+class _LocalJobStore:
+    def __init__(self):
+        self.jobs = TTLCache(maxsize=1024, ttl=JOB_TTL_SECONDS)
+        self.lock = threading.Lock()
+
+    def set(self, job_id: str, state: dict):
+        with self.lock:
+            self.jobs[job_id] = state
+
+    def get(self, job_id: str):
+        with self.lock:
+            return self.jobs.get(job_id)
+
+
+REDIS_URL = os.getenv("REDIS_URL", "").strip()
+JOB_STORE = _RedisJobStore(REDIS_URL) if REDIS_URL else _LocalJobStore()
+
+
+def _run_generation_job(job_id: str, topic: str):
+    suggestions_future = EXECUTOR.submit(generate_study_suggestions, topic) if gemini_model is not None else None
+    try:
+        result = call_deepseek(topic)
+    except Exception as e:
+        JOB_STORE.set(job_id, {"status": "failed", "error": str(e)})
+        return
+    _attach_study_suggestions(result, suggestions_future)
+    JOB_STORE.set(job_id, {"status": "done", "result": result})
+
+
+@app.route("/api/generate/async", methods=["POST", "OPTIONS"])
+def api_generate_async():
+    if request.method == "OPTIONS":
+        return Response(status=200)
+
+    data = request.get_json()
+    topic = data.get("topic", "").strip()
+
+    if not topic:
+        return jsonify({"error": "Topic required"}), 400
+
+    # Kick the LLM work onto the pool and answer immediately with a job
+    # id, so the HTTP request never blocks on the upstream call
+    job_id = uuid.uuid4().hex
+    JOB_STORE.set(job_id, {"status": "pending"})
+    EXECUTOR.submit(_run_generation_job, job_id, topic)
+
+    return jsonify({"job_id": job_id, "status_url": f"/api/generate/status/{job_id}"}), 202
+
+
+@app.route("/api/generate/status/<job_id>")
+def api_generate_status(job_id):
+    state = JOB_STORE.get(job_id)
+    if state is None:
+        return jsonify({"error": "Unknown or expired job"}), 404
+    return jsonify(state)
+
+
 # -------------------------------------------------------------
 # GENERATE STUDY SUGGESTIONS WITH GEMINI AI
 # -------------------------------------------------------------
 def generate_study_suggestions(topic: str):
     """Generate personalized study suggestions using Gemini AI"""
-    prompt = f"""
-    Based on the topic "{topic}" that the user just studied, suggest 3-4 closely related topics they should study next.
-    
-    For each suggestion, provide:
-    1. Topic name (short, specific, and relevant)
-    2. Brief description explaining why it's a good next step
-    
-    Format the response as a valid JSON array of objects with this exact structure:
-    [
-      {{
-        "topic": "specific topic name here",
-        "description": "brief explanation of why this is a good next topic, maximum 15 words"
-      }},
-      ...
-    ]
-    
-    Make sure topics are:
-    - Directly related to {topic}
-    - Logical progression from what was learned
-    - Not too advanced or too basic
-    - Specific and actionable
-    
-    Return ONLY the JSON array, no additional text.
-    """
-    
+    if gemini_model is None:
+        raise Exception("Gemini is not configured")
+
+    cache_key = topic.strip().lower()
+    with CACHE_LOCK:
+        cached = SUGGESTION_CACHE.get(cache_key)
+    if cached is not None:
+        return cached
+
+    prompt = SUGGESTIONS_PROMPT_TEMPLATE.format(topic=topic)
+
     try:
-        response = gemini_model.generate_content(prompt)
+        # 3-4 short suggestions fit well under 256 tokens; the cap stops
+        # a rambling completion from costing tokens and latency
+        response = gemini_model.generate_content(
+            prompt,
+            generation_config={"max_output_tokens": 256}
+        )
         text = response.text.strip()
         
         # Clean the response
         text = text.replace("```json", "").replace("```", "").strip()
         
         # Find JSON array
-        start = text.find('[')
-        end = text.rfind(']') + 1
-        if start == -1 or end <= 0:
+        json_text = _extract_json_block(text, open_char='[', close_char=']')
+        if json_text is None:
             raise Exception("No JSON array found in response")
-        
-        json_text = text[start:end].strip()
-        suggestions = json.loads(json_text)
+
+        suggestions = orjson.loads(json_text)
         
         # Ensure we have 3-4 suggestions
         if len(suggestions) < 3:
@@ -130,8 +500,11 @@ def generate_study_suggestions(topic: str):
                 {"topic": f"Related {topic} Concepts", "description": "Important related concepts and principles"}
             ]
             suggestions = suggestions[:3] + fallbacks[len(suggestions):3]
-        
-        return suggestions[:4]  # Return max 4 suggestions
+
+        suggestions = suggestions[:4]  # Return max 4 suggestions
+        with CACHE_LOCK:
+            SUGGESTION_CACHE[cache_key] = suggestions
+        return suggestions
         
     except Exception as e:
         print(f"Gemini API Error: {e}")
@@ -143,126 +516,351 @@ def generate_study_suggestions(topic: str):
         ]
 
 
+# -------------------------------------------------------------
+# MICRO-BATCHER - Coalesce concurrent topics into one DeepSeek call
+# -------------------------------------------------------------
+class _MicroBatcher:
+    """Group topics arriving within a short window into a single upstream call.
+
+    Callers get a Future per topic; a collector greenlet drains the queue,
+    waits at most the window for more arrivals, and hands the batch to a
+    small dispatch pool so collecting the next batch is never blocked by
+    an in-flight upstream call.
+    """
+
+    def __init__(self, window_seconds: float, max_batch: int):
+        self.window = window_seconds
+        self.max_batch = max_batch
+        self.queue = queue.Queue()
+        self.dispatch_pool = ThreadPoolExecutor(max_workers=4)
+        threading.Thread(target=self._collect, daemon=True).start()
+
+    def submit(self, topic: str) -> Future:
+        future = Future()
+        self.queue.put((topic, future))
+        return future
+
+    def _collect(self):
+        while True:
+            batch = [self.queue.get()]
+            deadline = time.monotonic() + self.window
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self.queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self.dispatch_pool.submit(self._dispatch, batch)
+
+    def _dispatch(self, batch):
+        # Duplicate topics in one window share a single slot in the call
+        by_topic = {}
+        for topic, future in batch:
+            by_topic.setdefault(topic, []).append(future)
+
+        # Try the coalesced call first, then discard any topic the model
+        # omitted or answered with an invalid lesson so it can be retried
+        # individually - batching must never make a request fail that
+        # would have succeeded on its own
+        results = {}
+        if len(by_topic) > 1:
+            try:
+                results = _generate_lesson_batch(list(by_topic))
+            except Exception:
+                results = {}
+            for topic, lesson in results.items():
+                if lesson is None:
+                    continue
+                try:
+                    _validate_lesson(lesson)
+                except Exception:
+                    results[topic] = None
+
+        for topic, futures in by_topic.items():
+            lesson = results.get(topic)
+            if lesson is None:
+                # Per-topic fallback through the single-topic prompt
+                try:
+                    lesson = _generate_lesson(topic)
+                except Exception as e:
+                    for future in futures:
+                        future.set_exception(e)
+                    continue
+            for future in futures:
+                future.set_result(lesson)
+
+
+# -------------------------------------------------------------
+# UPSTREAM PROTECTION - Concurrency bound + circuit breaker
+# -------------------------------------------------------------
+class UpstreamUnavailable(Exception):
+    """Raised when the circuit is open; surfaced to clients as HTTP 503"""
+
+
+class _CircuitBreaker:
+    """Fail fast when DeepSeek keeps failing instead of queueing 45s timeouts.
+
+    After `threshold` consecutive failures the circuit opens and callers are
+    rejected immediately for `cooldown` seconds. Once the cooldown elapses
+    calls flow again; a success resets the failure count, while another
+    failure reopens the circuit straight away.
+    """
+
+    def __init__(self, threshold: int, cooldown: float):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self.lock = threading.Lock()
+
+    def before_call(self):
+        with self.lock:
+            if self.opened_at is None:
+                return
+            if time.monotonic() - self.opened_at < self.cooldown:
+                raise UpstreamUnavailable("DeepSeek temporarily unavailable, please retry shortly")
+            # Cooldown over: half-open, let calls through on probation
+            self.opened_at = None
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
+
+
+# Bound simultaneous upstream calls so a traffic spike can't open
+# hundreds of connections to OpenRouter; excess callers wait their turn
+UPSTREAM_SEMAPHORE = threading.BoundedSemaphore(int(os.getenv("DEEPSEEK_MAX_CONCURRENCY", "8")))
+BREAKER = _CircuitBreaker(
+    threshold=int(os.getenv("DEEPSEEK_BREAKER_THRESHOLD", "5")),
+    cooldown=float(os.getenv("DEEPSEEK_BREAKER_COOLDOWN_S", "30"))
+)
+
+
+# Batching is tunable: DEEPSEEK_BATCH_WINDOW_MS=0 disables it entirely
+DEEPSEEK_BATCH_WINDOW_MS = int(os.getenv("DEEPSEEK_BATCH_WINDOW_MS", "50"))
+DEEPSEEK_BATCH_MAX = int(os.getenv("DEEPSEEK_BATCH_MAX", "4"))
+BATCHER = _MicroBatcher(DEEPSEEK_BATCH_WINDOW_MS / 1000.0, DEEPSEEK_BATCH_MAX) if DEEPSEEK_BATCH_WINDOW_MS > 0 else None
+
+
 # -------------------------------------------------------------
 # DEEPSEEK CALL - Returns Teaching Content + Flashcards + Quiz + Test
 # -------------------------------------------------------------
+# Single-flight map: while a topic is being generated, later callers for
+# the same key wait on the leader's Future instead of going upstream
+INFLIGHT = {}
+INFLIGHT_LOCK = threading.Lock()
+
+
 def call_deepseek(topic: str):
-    prompt = f"""
-Return ONLY valid JSON. No markdown, no notes, no explanations.
+    cache_key = _lesson_cache_key(topic)
+    with CACHE_LOCK:
+        cached = LESSON_CACHE.get(cache_key)
+    if cached is not None:
+        # Shallow copy so callers can attach study_suggestions without
+        # mutating the cached entry
+        return dict(cached)
+
+    with INFLIGHT_LOCK:
+        leader_future = INFLIGHT.get(cache_key)
+        is_leader = leader_future is None
+        if is_leader:
+            leader_future = Future()
+            INFLIGHT[cache_key] = leader_future
+
+    if not is_leader:
+        return dict(leader_future.result())
 
-Generate comprehensive learning content for the topic: "{topic}"
+    try:
+        if BATCHER is not None:
+            data = BATCHER.submit(topic).result()
+        else:
+            data = _generate_lesson(topic)
 
-Your output MUST follow the EXACT structure:
+        _validate_lesson(data)
 
-{{
-  "teaching_content": {{
-    "title": "string",
-    "introduction": "string",
-    "sections": [
-      {{
-        "heading": "string",
-        "content": "string"
-      }}
-    ],
-    "summary": "string"
-  }},
-  "flashcards": [
-    {{
-      "title": "string",
-      "explanation": "string",
-      "key_point": "string"
-    }}
-  ],
-  "quiz": [
-    {{
-      "question": "string",
-      "options": ["A", "B", "C", "D"],
-      "answer": "string"  // Must be EXACT text of one of the options
-    }}
-  ],
-  "test": {{
-    "mcq_questions": [
-      {{
-        "question": "string",
-        "options": ["A", "B", "C", "D"],
-        "answer": "string",  // Must be EXACT text of one of the options
-        "explanation": "string"
-      }}
-    ],
-    "qa_questions": [
-      {{
-        "question": "string",
-        "answer": "string"
-      }}
-    ]
-  }}
-}}
-
-STRICT RULES:
-1. teaching_content: Provide a complete lesson with introduction, 3-5 sections, and summary
-2. Exactly 5 flashcards
-3. Exactly 5 quiz questions
-4. test: Provide 5 MCQ questions and 3 Q&A questions
-5. All MCQ questions must have exactly 4 options
-6. Answers must match EXACTLY one of the options (case-sensitive)
-7. No text outside JSON
-8. Ensure quiz answers are always present in the options
-"""
+        with CACHE_LOCK:
+            LESSON_CACHE[cache_key] = data
+        leader_future.set_result(data)
+    except Exception as e:
+        leader_future.set_exception(e)
+        raise
+    finally:
+        with INFLIGHT_LOCK:
+            INFLIGHT.pop(cache_key, None)
 
-    headers = {
-        "Authorization": f"Bearer {DEEPSEEK_API_KEY}",
-        "Content-Type": "application/json",
-        "HTTP-Referer": "http://localhost",
-        "X-Title": "Explainify"
-    }
+    return dict(data)
+
+
+def _generate_lesson(topic: str, on_delta=None):
+    """Fetch and parse a lesson for a single topic from DeepSeek"""
+    return _deepseek_completion(DEEPSEEK_PROMPT_TEMPLATE.format(topic=topic), on_delta)
 
+
+def _generate_lesson_batch(topics):
+    """Fetch lessons for several topics with one DeepSeek call.
+
+    Returns a dict mapping each requested topic to its lesson, or to None
+    if the model left that topic out of the response.
+    """
+    topic_list = ", ".join(f'"{t}"' for t in topics)
+    data = _deepseek_completion(
+        DEEPSEEK_BATCH_PROMPT_TEMPLATE.format(topics=topic_list),
+        max_tokens=DEEPSEEK_MAX_TOKENS * len(topics)
+    )
+
+    # The model may echo topic keys with different case or whitespace
+    normalized = {key.strip().lower(): value for key, value in data.items()}
+    return {t: normalized.get(t.strip().lower()) for t in topics}
+
+
+def _deepseek_completion(prompt: str, on_delta=None, max_tokens=None):
+    BREAKER.before_call()
+    with UPSTREAM_SEMAPHORE:
+        try:
+            data = _deepseek_request(prompt, on_delta, max_tokens)
+        except Exception:
+            BREAKER.record_failure()
+            raise
+    BREAKER.record_success()
+    return data
+
+
+def _deepseek_request(prompt: str, on_delta=None, max_tokens=None):
     payload = {
-        "model": "deepseek/deepseek-chat",
+        "model": DEEPSEEK_MODEL,
         "messages": [{"role": "user", "content": prompt}],
-        "temperature": 0.4
+        "temperature": DEEPSEEK_TEMPERATURE,
+        "max_tokens": max_tokens if max_tokens is not None else DEEPSEEK_MAX_TOKENS,
+        "response_format": {"type": "json_object"},
+        "stream": True
     }
 
-    res = requests.post(DEEPSEEK_URL, headers=headers, json=payload, timeout=45)
+    res = SESSION.post(DEEPSEEK_URL, headers=DEEPSEEK_HEADERS, json=payload, timeout=45, stream=True)
 
     if res.status_code != 200:
         raise Exception("DeepSeek API Error: " + res.text)
 
-    raw = res.json()
-    text = raw["choices"][0]["message"]["content"].strip()
+    # Consume the SSE stream as it arrives: collect the delta chunks and
+    # join once, instead of buffering the full response envelope and then
+    # re-parsing and re-copying the content string
+    chunks = []
+    for line in res.iter_lines(decode_unicode=True):
+        if not line or not line.startswith("data:"):
+            continue
+        data_str = line[len("data:"):].strip()
+        if data_str == "[DONE]":
+            break
+        choices = orjson.loads(data_str).get("choices")
+        if not choices:
+            continue
+        piece = choices[0].get("delta", {}).get("content")
+        if piece:
+            chunks.append(piece)
+            if on_delta is not None:
+                on_delta(piece)
+
+    text = "".join(chunks).strip()
+
+    # Fast path: with JSON mode the content is already bare JSON, so
+    # decode the joined text directly without any intermediate copies
+    try:
+        return orjson.loads(text)
+    except Exception:
+        pass
 
-    # Remove accidental code fences
+    # Salvage path: strip accidental code fences, pull out the first
+    # balanced JSON block and parse that
     text = text.replace("```json", "").replace("```", "").strip()
-
-    # Extract JSON block
-    start = text.find("{")
-    end = text.rfind("}") + 1
-    if start == -1 or end <= 0:
+    json_text = _extract_json_block(text)
+    if json_text is None:
         raise Exception("DeepSeek did not return JSON")
 
-    json_text = text[start:end].strip()
-
-    # Parse JSON
     try:
-        data = json.loads(json_text)
+        return orjson.loads(json_text)
     except Exception as e:
         raise Exception("Invalid JSON from DeepSeek: " + str(e))
 
-    # Validate presence of sections
-    required_fields = ["teaching_content", "flashcards", "quiz", "test"]
-    for field in required_fields:
-        if field not in data:
-            raise Exception(f"DeepSeek JSON missing required field: {field}")
+
+# Struct models for a generated lesson. msgspec checks the whole nested
+# structure in one C pass, replacing the interpreted jsonschema walk.
+FourOptions = Annotated[list[str], msgspec.Meta(min_length=4, max_length=4)]
+
+
+class _Section(msgspec.Struct):
+    heading: str
+    content: str
+
+
+class _TeachingContent(msgspec.Struct):
+    title: str
+    introduction: str
+    sections: list[_Section]
+    summary: str
+
+
+class _Flashcard(msgspec.Struct):
+    title: str
+    explanation: str
+    key_point: str
+
+
+class _QuizQuestion(msgspec.Struct):
+    question: str
+    options: FourOptions
+    answer: str
+
+
+class _McqQuestion(msgspec.Struct):
+    question: str
+    options: FourOptions
+    answer: str
+    explanation: str = ""
+
+
+class _QaQuestion(msgspec.Struct):
+    question: str
+    answer: str
+
+
+class _Test(msgspec.Struct):
+    mcq_questions: list[_McqQuestion]
+    qa_questions: list[_QaQuestion]
+
+
+class _Lesson(msgspec.Struct):
+    teaching_content: _TeachingContent
+    flashcards: list[_Flashcard]
+    quiz: list[_QuizQuestion]
+    test: _Test
+
+
+def _validate_lesson(data):
+    """Check a parsed lesson for required structure and consistent answers"""
+    if data is None:
+        raise Exception("DeepSeek response did not include this topic")
+
+    # Validate the nested structure in a single typed pass
+    try:
+        msgspec.convert(data, _Lesson)
+    except msgspec.ValidationError as e:
+        raise Exception(f"DeepSeek JSON failed validation: {e}")
 
     # Validate quiz answers
     validate_quiz_answers(data["quiz"])
-    
+
     # Validate test answers
     for mcq in data["test"]["mcq_questions"]:
         if mcq["answer"] not in mcq["options"]:
             raise Exception(f"Test MCQ answer '{mcq['answer']}' not found in options")
 
-    return data
-
 
 def validate_quiz_answers(quiz_questions):
     """Validate that quiz answers match one of the options"""
@@ -276,10 +874,11 @@ def validate_quiz_answers(quiz_questions):
         if not options or len(options) != 4:
             raise Exception(f"Quiz question {i+1} must have exactly 4 options")
         
-        # Check if answer matches any option (case-insensitive for flexibility)
+        # Check if answer matches any option (case-insensitive for flexibility);
+        # a set gives O(1) membership instead of scanning the list
         answer_lower = answer.lower()
-        options_lower = [opt.lower() for opt in options]
-        
+        options_lower = {opt.lower() for opt in options}
+
         if answer_lower not in options_lower:
             # Try to find partial matches
             found = False
@@ -297,9 +896,13 @@ def validate_quiz_answers(quiz_questions):
 # -------------------------------------------------------------
 # STATIC FILES
 # -------------------------------------------------------------
+# In production, put Nginx (or a CDN) in front so static requests never
+# reach the WSGI workers at all - see deploy/nginx.conf. These routes
+# remain as the fallback for local dev and single-process deploys, with
+# cache headers so browsers and CDNs can absorb repeat hits.
 @app.route("/<path:path>")
 def static_files(path):
-    return send_from_directory(".", path)
+    return send_from_directory(".", path, max_age=3600)
 
 
 # -------------------------------------------------------------
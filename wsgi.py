@@ -0,0 +1,8 @@
+# ============================================================
+# Explainify — WSGI entry point for Gunicorn
+# ============================================================
+
+from server import app
+
+if __name__ == "__main__":
+    app.run()